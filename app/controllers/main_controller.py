@@ -1,17 +1,37 @@
 from __future__ import annotations
 
+import math
+from itertools import count
+from types import MappingProxyType
+
 import numpy as np
 
+from PySide6.QtCore import QObject, Qt, QThreadPool, QTimer, Signal
 from PySide6.QtWidgets import QApplication
 from pyqtgraph import HistogramLUTItem, ROI
 
 from app.helpers.interfaces import EventsHandler
-from app.helpers import dcm_manager
+from app.helpers import dcm_manager, kernels
 from app.helpers.enums import Plain, Location
 from app.model.model import Model
 from app.views.main_window import MainWindow
 from app.views.projection_view import ProjectionWidget, MetadataItem
 
+# enum members used in event handlers, bound once to module globals
+_BOTTOM_LEFT, _BOTTOM_RIGHT = Location.BOTTOM_LEFT, Location.BOTTOM_RIGHT
+
+# image orientation (image side -> patient side) of orthogonal projections; shared by all loaded models
+_XY_ORIENTATION = MappingProxyType({'up': "P", 'bottom': "A", 'left': "R", 'right': "L"})
+_XZ_ORIENTATION = MappingProxyType({'up': "S", 'bottom': "I", 'left': "R", 'right': "L"})
+_YZ_ORIENTATION = MappingProxyType({'up': "S", 'bottom': "I", 'left': "A", 'right': "P"})
+
+
+class SliceNotifier(QObject):
+    """Delivers slices extracted in background threads to GUI thread. Notifier is created in GUI thread and its
+    signal is connected with queued connection, so the slot is invoked by GUI thread event loop.
+    Signal arguments: plain, slice number, job id, slice image."""
+    sigSliceExtracted = Signal(object, int, int, object)
+
 
 class MainController(EventsHandler):
     """
@@ -33,8 +53,26 @@ class MainController(EventsHandler):
         yz_widget: ProjectionWidget
         projection_widgets: dict(ProjectionWidget)
             may be more useful if we would like to display "custom" slices in the future (not only orthogonal)
+        __roi_pending: dict(ROI)
+            changed ROIs (per plain) which statistics have not been updated yet
+        __roi_timers: dict(QTimer)
+            single shot timers (per plain) that coalesce ROI changes, so ROI statistics are updated
+            at most once per ROI_UPDATE_INTERVAL ms
+        __slicers: dict(callable)
+            functions (per orthogonal plain) that extract n-th slice from model matrix
+        __last_slices: dict(int)
+            number of last displayed slice (per plain); allows to determine slider motion direction
+        __slice_job_ids: itertools.count
+            source of unique slice request ids
+        __slice_jobs: dict(int)
+            id of the latest slice request (per plain); results of older requests are dropped
+        __slice_notifier: SliceNotifier
+            delivers slices extracted in background threads to GUI thread
     """
 
+    ROI_UPDATE_INTERVAL = 16
+    PREFETCH_SLICES = 2
+
     def __init__(self,
                  app: QApplication,
                  model: Model,
@@ -55,6 +93,22 @@ class MainController(EventsHandler):
         self.xy_widget, self.xz_widget, self.yz_widget = projections
         self.projection_widgets = {Plain.XY: self.xy_widget, Plain.XZ: self.xz_widget, Plain.YZ: self.yz_widget}
 
+        self.__slicers = {
+            Plain.XY: lambda matrix_3d, n: matrix_3d[n, :, :],
+            Plain.XZ: lambda matrix_3d, n: matrix_3d[:, n, :],
+            Plain.YZ: lambda matrix_3d, n: np.ascontiguousarray(matrix_3d[:, :, n])
+        }
+
+        self.__last_slices = {}
+
+        self.__slice_job_ids = count()
+        self.__slice_jobs = {}
+        self.__slice_notifier = SliceNotifier()
+        self.__slice_notifier.sigSliceExtracted.connect(self.__slice_extracted, Qt.ConnectionType.QueuedConnection)
+
+        self.__roi_pending = {}
+        self.__roi_timers = {plain: self.__create_roi_timer(plain) for plain in self.projection_widgets}
+
     def set_main_window(self, main_window):
         """Connect main window to controller. It is necessary to do it before app starting."""
         self.main_window = main_window
@@ -78,19 +132,21 @@ class MainController(EventsHandler):
         self.main_window.show_toolbar()
 
     def change_slice_handle(self, n, plain):
-        """Extract n-th slice in specified plain. Update model and views."""
+        """Display n-th slice in specified plain. Cached slice is displayed immediately; otherwise slice
+        is extracted in background thread and displayed when it is ready (unless newer slice has been
+        requested in the meantime)."""
 
-        proj_widget = self.__get_projection_widget(plain)
-        proj_model = self.model.get_projection_model(plain)
+        job_id = next(self.__slice_job_ids)
+        self.__slice_jobs[plain] = job_id
 
-        img = self.__orthogonal_slicing(n, plain)
-        proj_model.set_current_slice(img, n)
-        proj_widget.update_image(img)
+        img = self.model.get_projection_model(plain).get_cached_slice(n)
+        if img is not None:
+            self.__display_slice(img, n, plain)
+            return
 
-        updated_md = proj_model.update_img_metadata({
-            "Slice": f"{n + 1}/{proj_model.get_slices_count()}"
-        })
-        proj_widget.get_metadata_item(Location.BOTTOM_LEFT).set_metadata(updated_md)
+        notifier = self.__slice_notifier
+        QThreadPool.globalInstance().start(
+            lambda: notifier.sigSliceExtracted.emit(plain, n, job_id, self.__orthogonal_slicing(n, plain)))
 
     def histogram_mode_handle(self, visible):
         """Based on visible value, hide (False) or display (True) histogram in all projection widgets"""
@@ -113,49 +169,84 @@ class MainController(EventsHandler):
             "Window Width": str(width),
             "Window Level": str(center)
         })
-        proj_widget.get_metadata_item(Location.BOTTOM_LEFT).set_metadata(proj_model.get_img_metadata())
+        proj_widget.get_metadata_item(_BOTTOM_LEFT).set_text(proj_model.get_img_metadata_text())
 
     def roi_mode_handle(self, visible):
         """Based on visible value, hide (False) or display (True) ROI in all projection widgets"""
         for projection in self.projection_widgets.values():
             projection.set_roi_visibility(visible)
             if not visible:
-                projection.get_metadata_item(Location.BOTTOM_RIGHT).clear()
+                projection.get_metadata_item(_BOTTOM_RIGHT).clear()
 
     def roi_changed_handle(self, roi: ROI, plain, changed_size=True):
-        """Update ROI metadata in specified plain and based on changed ROI. If ROI size has not been changed,
+        """Schedule ROI metadata update in specified plain. Changes that occur before the update
+        are coalesced, so only the latest ROI state is processed."""
+
+        self.__roi_pending[plain] = roi
+        timer = self.__roi_timers[plain]
+        if not timer.isActive():
+            timer.start()
+
+    def quit_app_handle(self):
+        self.app.exit(0)
+
+    def __create_roi_timer(self, plain):
+        """Create single shot timer that triggers pending ROI metadata update in specified plain."""
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.setInterval(self.ROI_UPDATE_INTERVAL)
+        timer.timeout.connect(lambda: self.__update_roi_metadata(plain))
+        return timer
+
+    def __update_roi_metadata(self, plain):
+        """Update ROI metadata in specified plain and based on pending ROI. If ROI size has not been changed,
         keep previous calculated area"""
 
+        roi = self.__roi_pending.pop(plain, None)
         proj_widget = self.__get_projection_widget(plain)
         proj_model = self.model.get_projection_model(plain)
 
-        if not proj_widget.roi_is_visible:
+        if roi is None or not proj_widget.roi_is_visible:
             return
 
-        img_item = proj_widget.get_image_item()
-        roi_matrix = roi.getArrayRegion(data=proj_model.get_current_slice_img(), img=img_item)
+        img = proj_model.get_current_slice_img()
+        if roi.angle() == 0:
+            y0, y1, x0, x1 = self.__get_roi_bounds(roi, img.shape)
+            roi_matrix = img[y0:y1, x0:x1]
+        else:
+            roi_matrix = roi.getArrayRegion(data=img, img=proj_widget.get_image_item())
+
+        pixel_height, pixel_width = roi_matrix.shape
+        roi_mean, roi_std = kernels.mean_std(roi_matrix)
 
-        pixel_width, pixel_height = np.shape(roi_matrix)
         col_spacing, row_spacing = proj_model.get_spacings()
 
+        roi_metadata = {
+            "Mean": f"{roi_mean:.2f}",
+            "Std Dev": f"{roi_std:.2f}"
+        }
+
         prev_roi_size = proj_model.prev_roi_pix_size
         if not (pixel_width, pixel_height) == prev_roi_size:
             proj_model.prev_roi_pix_size = pixel_width, pixel_height
             roi_mm_area = pixel_width * col_spacing * pixel_height * row_spacing
-            proj_model.update_roi_metadata({"Area": f"{roi_mm_area:.2f} mm2"})
-
-        roi_mean = np.mean(roi_matrix)
-        roi_std = np.std(roi_matrix)
-
-        md_item: MetadataItem = proj_widget.get_metadata_item(Location.BOTTOM_RIGHT)
-        proj_model.update_roi_metadata({
-            "Mean": f"{roi_mean:.2f}",
-            "Std Dev": f"{roi_std:.2f}"
-        })
-        md_item.set_metadata(proj_model.get_roi_metadata(), color='yellow')
-
-    def quit_app_handle(self):
-        self.app.exit(0)
+            roi_metadata["Area"] = f"{roi_mm_area:.2f} mm2"
+
+        md_item: MetadataItem = proj_widget.get_metadata_item(_BOTTOM_RIGHT)
+        proj_model.update_roi_metadata(roi_metadata)
+        md_item.batch_update(proj_model.get_roi_metadata().items(), color='yellow')
+
+    @staticmethod
+    def __get_roi_bounds(roi: ROI, shape):
+        """Return integer bounds (y0, y1, x0, x1) of whole pixels covered by not rotated ROI, clipped to image
+        of specified shape"""
+        height, width = shape
+        x, y = roi.pos()
+        roi_width, roi_height = roi.size()
+        x0, y0 = math.floor(x), math.floor(y)
+        x1, y1 = x0 + math.ceil(roi_width), y0 + math.ceil(roi_height)
+        return (min(max(y0, 0), height), min(max(y1, 0), height),
+                min(max(x0, 0), width), min(max(x1, 0), width))
 
     def __model_preset(self, ct_slices):
         """Set main model and projections models based on source dcm files.
@@ -164,7 +255,7 @@ class MainController(EventsHandler):
         matrix_3d = dcm_manager.get_ct_model_as_matrix(ct_slices, rot_k=1)
         self.model.set_model_matrix(matrix_3d)
 
-        x_size, y_size, z_size = matrix_3d.shape
+        z_size, y_size, x_size = matrix_3d.shape
         metadata_slice = ct_slices[z_size // 2]
 
         slice_thickness = dcm_manager.get_ct_thickness(metadata_slice)
@@ -173,32 +264,17 @@ class MainController(EventsHandler):
         xy_model = self.model.get_projection_model(Plain.XY)
         xy_model.set_spacings(col_spacing, row_spacing, slice_thickness)
         xy_model.set_anatomical_plane("Axial")
-        xy_model.set_projection_orientation({
-            'up': "P",
-            'bottom': "A",
-            'left': "R",
-            'right': "L"
-        })
+        xy_model.set_projection_orientation(_XY_ORIENTATION)
 
         xz_model = self.model.get_projection_model(Plain.XZ)
         xz_model.set_spacings(col_spacing, slice_thickness, row_spacing)
         xz_model.set_anatomical_plane("Coronal")
-        xz_model.set_projection_orientation({
-            'up': "S",
-            'bottom': "I",
-            'left': "R",
-            'right': "L"
-        })
+        xz_model.set_projection_orientation(_XZ_ORIENTATION)
 
         yz_model = self.model.get_projection_model(Plain.YZ)
         yz_model.set_spacings(row_spacing, slice_thickness, col_spacing)
         yz_model.set_anatomical_plane("Sagittal")
-        yz_model.set_projection_orientation({
-            'up': "S",
-            'bottom': "I",
-            'left': "A",
-            'right': "P"
-        })
+        yz_model.set_projection_orientation(_YZ_ORIENTATION)
 
         patient_data = dcm_manager.get_patient_data(metadata_slice)
         examination_data = dcm_manager.get_examination_data(metadata_slice)
@@ -229,6 +305,7 @@ class MainController(EventsHandler):
         model = self.model.get_projection_model(plain)
 
         slices_count = model.get_slices_count()
+        projection.histogram.reset_cache()
         projection.connect_signals(
             lambda slider: self.change_slice_handle(slider, plain),
             lambda roi: self.roi_changed_handle(roi, plain),
@@ -236,8 +313,7 @@ class MainController(EventsHandler):
         )
         projection.set_slider(position=slices_count // 2, max_val=slices_count - 1)
 
-        x = projection.image_area.image_item.width()
-        y = projection.image_area.image_item.height()
+        x, y = model.get_img_size()
         roi_size = 0.3 * min(x, y)
 
         projection.image_area.roi.setSize(roi_size)
@@ -250,28 +326,67 @@ class MainController(EventsHandler):
         top_right_md.set_metadata(self.model.get_examination_metadata())
 
         bottom_left_md = projection.get_metadata_item(Location.BOTTOM_LEFT)
-        bottom_left_md.set_metadata(model.get_img_metadata())
+        bottom_left_md.set_text(model.get_img_metadata_text())
 
         orientation = model.get_projection_orientation()
         projection.set_projection_orientation(**orientation)
 
+    def __slice_extracted(self, plain, n, job_id, img):
+        """Display slice extracted in background thread if it is still the latest requested slice."""
+        if self.__slice_jobs.get(plain) == job_id:
+            self.__display_slice(img, n, plain)
+
+    def __display_slice(self, img, n, plain):
+        """Set n-th slice as current slice in specified plain. Update model and views (including ROI statistics).
+        Prefetch next slices in the direction of slider motion."""
+
+        proj_widget = self.__get_projection_widget(plain)
+        proj_model = self.model.get_projection_model(plain)
+
+        proj_model.set_current_slice(img, n)
+        proj_widget.update_image(img, histogram_key=n)
+
+        proj_widget.get_metadata_item(_BOTTOM_LEFT).set_text(proj_model.get_img_metadata_text())
+        self.roi_changed_handle(proj_widget.image_area.roi, plain)
+
+        direction = 1 if n >= self.__last_slices.get(plain, n) else -1
+        self.__last_slices[plain] = n
+        self.__prefetch_slices(n, direction, plain)
+
+    def __prefetch_slices(self, n, direction, plain):
+        """Extract (in background thread) PREFETCH_SLICES slices following n-th slice in specified direction
+        and store them in projection model slices cache."""
+
+        proj_model = self.model.get_projection_model(plain)
+        slices_count = proj_model.get_slices_count()
+        next_slices = [k for k in range(n + direction, n + direction * (self.PREFETCH_SLICES + 1), direction)
+                       if 0 <= k < slices_count and proj_model.get_cached_slice(k) is None]
+
+        if next_slices:
+            QThreadPool.globalInstance().start(lambda: [self.__orthogonal_slicing(k, plain) for k in next_slices])
+
     def __get_projection_widget(self, plain):
         """Return specified orthogonal widget"""
         return self.projection_widgets[plain]
 
     def __orthogonal_slicing(self, n, plain):
         """
-        Calculate n-th slice in specified plain.
-        - matrix_3d[n] / matrix_3d[n, :, :] => n-th row for each height and col (YZ slice / slice normal to x-axis)
-        - matrix_3d[:, n] / matrix_3d[:, n, :] => n-th  col for each height and row (XZ slice / slice normal to y-axis)
-        - matrix_3d[:, :, n] => n-th height for each XY plain (XY slice / slice normal to z-axis)
+        Calculate n-th slice in specified plain (or take it from slices cache).
+        - matrix_3d[n] / matrix_3d[n, :, :] => n-th height for each XY plain (XY slice / slice normal to z-axis)
+        - matrix_3d[:, n] / matrix_3d[:, n, :] => n-th row for each height and col (XZ slice / slice normal to y-axis)
+        - matrix_3d[:, :, n] => n-th col for each height and row (YZ slice / slice normal to x-axis)
         """
 
-        if plain == Plain.XY:
-            return self.model.get_model_matrix()[:, :, n]
-        elif plain == Plain.XZ:
-            return self.model.get_model_matrix()[:, n, :]
-        elif plain == Plain.YZ:
-            return self.model.get_model_matrix()[n, :, :]
-        else:
+        proj_model = self.model.get_projection_model(plain)
+        img = proj_model.get_cached_slice(n)
+        if img is not None:
+            return img
+
+        slicer = self.__slicers.get(plain)
+        if slicer is None:
             raise AssertionError("Cannot slicing in not orthogonal plains")
+        generation = proj_model.get_slice_cache_generation()
+        img = slicer(self.model.get_model_matrix(), n)
+
+        proj_model.cache_slice(img, n, generation)
+        return img
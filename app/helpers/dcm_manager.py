@@ -1,56 +1,115 @@
 from __future__ import annotations
 
-import glob
 import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
 import numpy as np
 import pydicom
+from pydicom.pixel_data_handlers import (numpy_handler, pylibjpeg_handler, gdcm_handler, rle_handler,
+                                         pillow_handler, jpeg_ls_handler)
+
+
+# compressed pixel data is decoded with native decoders (pylibjpeg, GDCM) when they are available;
+# handlers which dependencies are not installed are skipped by pydicom
+pydicom.config.pixel_data_handlers = [
+    numpy_handler,
+    pylibjpeg_handler,
+    gdcm_handler,
+    rle_handler,
+    pillow_handler,
+    jpeg_ls_handler
+]
+
+DCM_READ_WORKERS = min(32, (os.cpu_count() or 1) * 4)
 
 
 def get_dcm_from_path(src_path: str | list[str]):
     """Get dcm files source (directory path/file path/list of files paths)
     and return dcm data set / list of data sets"""
 
-    if type(src_path) is list:
+    if isinstance(src_path, list):
         if len(src_path) == 1:
             return pydicom.dcmread(src_path[0])
         else:
-            return [pydicom.dcmread(f) for f in src_path]
-    elif os.path.isdir(src_path):
-        files = glob.glob(src_path + "/*.dcm", recursive=False)
-        dcm_files = [pydicom.dcmread(f) for f in files]
+            return read_dcm_files(src_path)
+
+    try:
+        mode = os.stat(src_path).st_mode
+    except (OSError, TypeError, ValueError):
+        mode = 0
+
+    if stat.S_ISDIR(mode):
+        with os.scandir(src_path) as entries:
+            files = [entry.path for entry in entries
+                     if entry.name.endswith(".dcm") and not entry.name.startswith(".") and entry.is_file()]
+        dcm_files = read_dcm_files(files)
         return dcm_files
-    elif os.path.isfile(src_path):
+    elif stat.S_ISREG(mode):
         return pydicom.dcmread(src_path)
     else:
         raise ValueError(f"Expected a directory or files list, but {type(src_path)} has been provided")
 
 
+def read_dcm_files(files: list[str]):
+    """Read list of dcm files concurrently and return list of data sets in the same order as files paths.
+    Pixel data is read and decoded in worker threads too, so the whole I/O and decoding runs in parallel."""
+    with ThreadPoolExecutor(max_workers=DCM_READ_WORKERS) as executor:
+        return list(executor.map(read_dcm_file, files))
+
+
+def read_dcm_file(file: str):
+    """Read dcm file and decode its pixel data (if present). Pixel data in transfer syntax without available
+    handler is left as is, so the error is raised only when the pixel array is used."""
+    dcm_dataset = pydicom.dcmread(file)
+    if 'PixelData' in dcm_dataset:
+        try:
+            dcm_dataset.pixel_array
+        except (NotImplementedError, RuntimeError):
+            # no handler supports the transfer syntax / handlers are missing dependencies
+            pass
+    return dcm_dataset
+
+
 def extract_ct_from_dcm(dcm_files):
-    """Get list of dcm_files and extract CT dicom files. Return list of dcm_files sorted ascending by SliceLocation"""
-    ct_slices = []
+    """Get list of dcm_files and extract CT dicom files. Return list of dcm_files sorted ascending by SliceLocation
+    (files without SliceLocation are treated as located at 0.0)"""
+    located_slices = []
     for dcm_f in dcm_files:
-        if hasattr(dcm_f, 'SliceLocation') or (hasattr(dcm_f, 'SliceThickness') and dcm_f.SliceThickness != 0):
-            ct_slices.append(dcm_f)
-    return sorted(ct_slices, key=lambda dcm_f: dcm_f.SliceLocation)
+        location = dcm_f.get('SliceLocation')
+        if location is not None or dcm_f.get('SliceThickness'):
+            located_slices.append((float(location) if location is not None else 0.0, dcm_f))
+    located_slices.sort(key=itemgetter(0))
+    return [dcm_f for _, dcm_f in located_slices]
 
 
 def get_ct_model_as_matrix(dcm_files: list[pydicom.FileDataset], rot_k=0):
     """Get list CT dcm files and create 3d matrix based on it. CT images are located in XY plane and along Z-axis.
+    Matrix is indexed as matrix_3d[z, y, x] and stored as int16 if pixel values fit it (wider dtype otherwise).
     rot_k parameter allows to rotate CT images by rot_k*90 degrees (counterclockwise)."""
 
-    z_size = len(dcm_files)
-    x_size, y_size = dcm_files[z_size // 2].pixel_array.shape
-    matrix_3d = np.zeros([x_size, y_size, z_size])
+    pixel_arrays = [ct_s.pixel_array for ct_s in dcm_files]
+    if all(fits_int16(pixel_array) for pixel_array in pixel_arrays):
+        matrix_3d = np.stack(pixel_arrays, axis=0, dtype=np.int16, casting='unsafe')
+    else:
+        dtype = np.result_type(np.int16, *pixel_arrays)
+        matrix_3d = np.stack(pixel_arrays, axis=0, dtype=dtype)
 
     if rot_k % 4 != 0:
-        for z, ct_s in enumerate(dcm_files):
-            matrix_3d[:, :, -z] = np.rot90(ct_s.pixel_array, k=rot_k)
-    else:
-        for z, ct_s in enumerate(dcm_files):
-            matrix_3d[:, :, -z] = ct_s.pixel_array
+        matrix_3d = np.rot90(matrix_3d, k=rot_k, axes=(1, 2))
+
+    return np.ascontiguousarray(matrix_3d[::-1].swapaxes(1, 2))
+
 
-    return matrix_3d
+def fits_int16(pixel_array):
+    """Return True if all pixel values can be stored as int16 without changing them"""
+    if np.can_cast(pixel_array.dtype, np.int16):
+        return True
+    if pixel_array.dtype.kind not in 'iu':
+        return False
+    info = np.iinfo(np.int16)
+    return pixel_array.size == 0 or (pixel_array.min() >= info.min and pixel_array.max() <= info.max)
 
 
 def get_ct_thickness(dcm_dataset):
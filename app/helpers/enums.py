@@ -1,10 +1,10 @@
-from enum import Enum
+from enum import Enum, IntEnum
 
 
-class Plain(Enum):
-    XY = "XY"
-    XZ = "XZ"
-    YZ = "YZ"
+class Plain(IntEnum):
+    XY = 0
+    XZ = 1
+    YZ = 2
 
     # # along, horizontal, vertical axis
     # @staticmethod
@@ -25,13 +25,13 @@ class Plain(Enum):
 #     Z = "Z"
 
 
-class Location(Enum):
-    TOP = "Top"
-    BOTTOM = "Bottom"
-    LEFT = "Left"
-    RIGHT = "Right"
-    CENTER = "Center"
-    TOP_LEFT = "Top Left"
-    TOP_RIGHT = "Top Right"
-    BOTTOM_LEFT = "Bottom Left"
-    BOTTOM_RIGHT = "Bottom Right"
+class Location(IntEnum):
+    TOP = 0
+    BOTTOM = 1
+    LEFT = 2
+    RIGHT = 3
+    CENTER = 4
+    TOP_LEFT = 5
+    TOP_RIGHT = 6
+    BOTTOM_LEFT = 7
+    BOTTOM_RIGHT = 8
@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+from numba import get_num_threads, njit, prange
+
+
+@njit(cache=True, fastmath=True)
+def mean_std(matrix):
+    """Return (mean, standard deviation) of all elements of 2d matrix. Both values are computed in single pass
+    over the matrix from float64 sums of values and squared values (shifted by the first element, which keeps
+    variance precise). Return (nan, nan) for empty matrix."""
+    n = matrix.size
+    if n == 0:
+        return np.nan, np.nan
+
+    shift = float(matrix[0, 0])
+    total = 0.0
+    total_sq = 0.0
+    for row in matrix:
+        for x in row:
+            v = x - shift
+            total += v
+            total_sq += v * v
+
+    mean = total / n
+    return shift + mean, math.sqrt(max(total_sq / n - mean * mean, 0.0))
+
+
+@njit(cache=True)
+def min_max(matrix):
+    """Return (min, max) of all elements of 2d matrix, truncated to integers, computed in single pass."""
+    min_val = max_val = int(matrix[0, 0])
+    for row in matrix:
+        for x in row:
+            v = int(x)
+            if v < min_val:
+                min_val = v
+            elif v > max_val:
+                max_val = v
+    return min_val, max_val
+
+
+def bincount(matrix, offset, bin_width, n):
+    """Return counts of n bins of width bin_width, starting from offset, of 2d matrix elements (truncated
+    to integers). Matrix is read once, without temporary (shifted, divided) index array. Rows are split
+    between numba threads; each thread counts into its own local bins, which are merged at the end."""
+    return _bincount(matrix, offset, bin_width, n, get_num_threads())
+
+
+@njit(cache=True, parallel=True)
+def _bincount(matrix, offset, bin_width, n, threads):
+    rows = matrix.shape[0]
+    chunks = min(threads, rows)
+    local_counts = np.zeros((chunks, n), dtype=np.int64)
+    for chunk in prange(chunks):
+        for i in range(chunk * rows // chunks, (chunk + 1) * rows // chunks):
+            for x in matrix[i]:
+                local_counts[chunk, (int(x) - offset) // bin_width] += 1
+    return local_counts.sum(axis=0)
+
+
+def warm_up():
+    """Compile kernels before first usage, so compilation cost is not paid during user interaction."""
+    mean_std(np.zeros((2, 2), dtype=np.int16)[:, :1])
+    image = np.zeros((2, 2), dtype=np.float32)
+    min_max(image[::2, ::2])
+    bincount(image[::2, ::2], 0, 1, 1)
@@ -1,3 +1,6 @@
+from collections import OrderedDict
+from threading import Lock
+
 import numpy as np
 
 from app.helpers.enums import Plain
@@ -21,7 +24,7 @@ class Model:
      Attributes
     ----------
         __matrix_3d
-            voxel representation of the model
+            voxel representation of the model (indexed as [z, y, x])
         __patient_metadata: dict
             provided by controller class; e.g. patient name, age, sex, ...
         __examination_metadata: dict
@@ -33,6 +36,9 @@ class Model:
         __yz_projection
     """
 
+    __slots__ = ('__matrix_3d', '__patient_metadata', '__examination_metadata', '__projections_models',
+                 '__xy_projection', '__xz_projection', '__yz_projection')
+
     def __init__(self):
         super(Model, self).__init__()
 
@@ -52,15 +58,17 @@ class Model:
         }
 
     def set_model_matrix(self, matrix_3d: np.matrix):
-        """Set model as a 3d numpy array"""
-        x_size, y_size, z_size = matrix_3d.shape
+        """Set model as a 3d numpy array indexed as matrix_3d[z, y, x]"""
+        z_size, y_size, x_size = matrix_3d.shape
         self.__matrix_3d = matrix_3d
         self.__xy_projection.set_shape(x_size, y_size, z_size)
         self.__xz_projection.set_shape(x_size, z_size, y_size)
         self.__yz_projection.set_shape(y_size, z_size, x_size)
+        for projection in self.__projections_models.values():
+            projection.clear_slice_cache()
 
     def get_model_matrix(self):
-        """Return model as a 3d numpy array"""
+        """Return model as a 3d numpy array indexed as matrix_3d[z, y, x]"""
         return self.__matrix_3d
 
     def add_new_projection(self, plain_name):
@@ -129,12 +137,29 @@ class ProjectionModel:
             space between 2 pixels in one col (between rows) in mm
         __image_metadata
             basic metadata about projection model and current displayed image (e.g. slice number, size, ...)
+        __image_metadata_text
+            image metadata entries formatted as text (before and after "Slice" entry); None if outdated
         __roi_metadata
             metadata about current chosen ROI (e.g. area, mean pixel intensity, ...)
         prev_roi_pix_size
             last size of ROI (allows to skip area calculating when ROI size has been not changed)
+        __slice_cache: OrderedDict
+            recently extracted slices (LRU order), bounded to SLICE_CACHE_SIZE entries
+        __slice_cache_lock: Lock
+            slices may be cached from background (prefetching) threads
+        __slice_cache_generation
+            incremented whenever cache is cleared; slices extracted before clearing are not cached
     """
 
+    __slots__ = ('__plain', '__anatomical_plane', '__projection_orientation', '__slices_count',
+                 '__current_slice_num', '__current_slice_image', '__slices_width', '__slices_height',
+                 '__slice_thickness', '__col_spacing', '__row_spacing', '__image_metadata',
+                 '__image_metadata_text', '__roi_metadata',
+                 'prev_roi_pix_size', '__slice_cache', '__slice_cache_lock', '__slice_cache_generation')
+
+    SLICE_CACHE_SIZE = 32
+    SLICE_ENTRY = "Slice"
+
     def __init__(self, plain=None, anatomical_plane=None):
         self.__plain = plain
         self.__anatomical_plane = anatomical_plane
@@ -152,10 +177,15 @@ class ProjectionModel:
         self.__row_spacing = 0
 
         self.__image_metadata = {}
+        self.__image_metadata_text = None
         self.__roi_metadata = {}
 
         self.prev_roi_pix_size = 0, 0
 
+        self.__slice_cache = OrderedDict()
+        self.__slice_cache_lock = Lock()
+        self.__slice_cache_generation = 0
+
     def set_shape(self, width, height, depth):
         """Set width_height_depth shape of the projection model"""
         self.__slices_width = width
@@ -193,19 +223,70 @@ class ProjectionModel:
         self.__current_slice_image = img
         self.__current_slice_num = n
 
+    def get_cached_slice(self, n):
+        """Return n-th slice from slices cache (None if slice is not cached)"""
+        with self.__slice_cache_lock:
+            img = self.__slice_cache.get(n)
+            if img is not None:
+                self.__slice_cache.move_to_end(n)
+            return img
+
+    def get_slice_cache_generation(self):
+        """Return current slices cache generation (read it before extracting slice to be cached)"""
+        return self.__slice_cache_generation
+
+    def cache_slice(self, img, n, generation=None):
+        """Store n-th slice in slices cache. The least recently used slice is dropped when cache is full.
+        Slice is not stored if cache has been cleared since specified generation (slice is outdated)"""
+        with self.__slice_cache_lock:
+            if generation is not None and generation != self.__slice_cache_generation:
+                return
+            self.__slice_cache[n] = img
+            self.__slice_cache.move_to_end(n)
+            if len(self.__slice_cache) > self.SLICE_CACHE_SIZE:
+                self.__slice_cache.popitem(last=False)
+
+    def clear_slice_cache(self):
+        """Remove all cached slices (e.g. after model matrix has been changed)"""
+        with self.__slice_cache_lock:
+            self.__slice_cache.clear()
+            self.__slice_cache_generation += 1
+
     def set_img_metadata(self, img_metadata: dict):
         """Set image metadata as dict"""
         self.__image_metadata = img_metadata
+        self.__image_metadata_text = None
 
     def update_img_metadata(self, metadata: dict):
         """Update and add new attributes to existing image metadata"""
         for k, v in metadata.items():
             self.__image_metadata[k] = v
-        return self.__image_metadata
+        self.__image_metadata_text = None
+        return self.get_img_metadata()
 
     def get_img_metadata(self):
-        """Return image metadata dict"""
-        return self.__image_metadata
+        """Return copy of image metadata dict with "Slice" entry set to current slice number"""
+        img_metadata = dict(self.__image_metadata)
+        if self.SLICE_ENTRY in img_metadata:
+            img_metadata[self.SLICE_ENTRY] = self.__get_slice_entry_value()
+        return img_metadata
+
+    def get_img_metadata_text(self):
+        """Return image metadata as text (entries separated with <br>). Value of "Slice" entry is taken from
+        current slice number, so only this entry is formatted on slice change; text of other entries
+        is formatted once after metadata change."""
+        if self.__image_metadata_text is None:
+            entries = [f'{key}: {value}' for key, value in self.__image_metadata.items()]
+            keys = list(self.__image_metadata.keys())
+            split = keys.index(self.SLICE_ENTRY) if self.SLICE_ENTRY in keys else len(keys)
+            self.__image_metadata_text = entries[:split], entries[split + 1:]
+
+        head, tail = self.__image_metadata_text
+        slice_entry = f"{self.SLICE_ENTRY}: {self.__get_slice_entry_value()}"
+        return '<br>'.join(head + [slice_entry] + tail)
+
+    def __get_slice_entry_value(self):
+        return f"{self.__current_slice_num + 1}/{self.__slices_count}"
 
     def set_roi_metadata(self, roi_metadata):
         """Set roi metadata as dict"""
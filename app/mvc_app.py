@@ -1,4 +1,9 @@
+import signal
+import socket
+
+from PySide6.QtCore import QSocketNotifier
 from PySide6.QtWidgets import QApplication
+from app.helpers import kernels
 from app.model.model import Model
 from app.views.main_window import MainWindow
 from app.controllers.main_controller import MainController
@@ -9,6 +14,10 @@ class MvcApp(QApplication):
     def __init__(self, sys_argv):
         super(MvcApp, self).__init__(sys_argv)
 
+        self.__sigint_sockets, self.__sigint_notifier = self.__create_sigint_notifier()
+
+        kernels.warm_up()
+
         model = Model()
         projections = ProjectionWidget(), ProjectionWidget(), ProjectionWidget()
 
@@ -17,3 +26,27 @@ class MvcApp(QApplication):
         main_controller.set_main_window(main_view)
 
         main_view.show()
+
+    def __create_sigint_notifier(self):
+        """Quit app on SIGINT (Ctrl+C). Signal number is written to socket (wakeup fd), which wakes up
+        Qt event loop, so the app quits promptly and cleanly from the GUI thread."""
+        read_socket, write_socket = socket.socketpair()
+        read_socket.setblocking(False)
+        write_socket.setblocking(False)
+
+        signal.set_wakeup_fd(write_socket.fileno())
+        signal.signal(signal.SIGINT, lambda signum, frame: None)
+
+        notifier = QSocketNotifier(read_socket.fileno(), QSocketNotifier.Type.Read, self)
+        notifier.activated.connect(lambda: self.__handle_sigint(read_socket))
+        return (read_socket, write_socket), notifier
+
+    def __handle_sigint(self, read_socket):
+        """Drain wakeup socket and quit app if SIGINT has been received."""
+        try:
+            signals = read_socket.recv(64)
+        except BlockingIOError:
+            return
+
+        if signal.SIGINT in signals:
+            self.quit()
@@ -1,7 +1,12 @@
+from collections import OrderedDict
+
+import numpy as np
 import pyqtgraph as pg
+from PySide6.QtCore import QTimer, Signal
 from PySide6.QtGui import Qt
 from PySide6.QtWidgets import QSlider, QWidget, QHBoxLayout
 
+from app.helpers import kernels
 from app.helpers.enums import Location
 
 
@@ -19,15 +24,31 @@ class ProjectionWidget(QWidget):
             widget to displaying pyqtgraph plot item
         image_area: ImageArea
             represents image area (viewbox, image item, roi and all related to displayed image)
-        histogram: pyqtgraph.HistogramLUTItem
+        histogram: HistogramItem
         slicing_slider:
             slider that allows to change slices in projection
+        __slider_timer: QTimer
+            single shot timer that coalesces slider value changes (at most one slice change
+            per SLIDER_UPDATE_INTERVAL ms)
+        __pending_slice:
+            latest slider value which has not been handled yet
+        __image_buffer:
+            float32 scratch array reused for converting displayed images (allocated again only when image shape
+            changes)
+        sigSliceChanged: Signal(int)
+            emitted with the latest slider value when coalesced slice change occurs
     """
+
+    SLIDER_UPDATE_INTERVAL = 16
+
+    sigSliceChanged = Signal(int)
+
     def __init__(self, **kargs):
         super().__init__(**kargs)
 
         self.histogram_is_visible = False
         self.roi_is_visible = False
+        self.__image_buffer = None
 
         layout = QHBoxLayout()
         self.setLayout(layout)
@@ -39,48 +60,71 @@ class ProjectionWidget(QWidget):
         self.histogram = self.__create_histogram()
         self.__graphics_widget.ci.addItem(row=0, col=0, item=self.image_area)
 
+        self.__pending_slice = None
+        self.__slider_timer = self.__create_slider_timer()
         self.slicing_slider = self.__create_slider()
         layout.addWidget(self.slicing_slider)
 
     def __create_slider(self):
-        """Create vertical slider. Changing slider value event emits ROI changed signal."""
+        """Create vertical slider. Changing slider value schedules coalesced slice change."""
         slider = QSlider(orientation=Qt.Orientation.Vertical)
-        slider.valueChanged.connect(lambda x: self.image_area.roi.sigRegionChanged.emit(self.image_area.roi))
+        slider.valueChanged.connect(self.__schedule_slice_change)
         return slider
 
+    def __create_slider_timer(self):
+        """Create single shot timer that triggers pending slice change."""
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.setInterval(self.SLIDER_UPDATE_INTERVAL)
+        timer.timeout.connect(self.__emit_slice_change)
+        return timer
+
+    def __schedule_slice_change(self, value):
+        """Store the latest slider value and start slider timer (if it is not already started)."""
+        self.__pending_slice = value
+        if not self.__slider_timer.isActive():
+            self.__slider_timer.start()
+
+    def __emit_slice_change(self):
+        """Emit slice changed signal with the latest slider value. ROI is not re-emitted; slice change
+        handler refreshes ROI statistics once new slice is displayed."""
+        value, self.__pending_slice = self.__pending_slice, None
+        if value is None:
+            return
+        self.sigSliceChanged.emit(value)
+
     def __create_histogram(self):
         """Create vertical histogram (L=2000, W=2000)"""
-        histogram = pg.HistogramLUTItem(orientation='vertical')
+        histogram = HistogramItem(orientation='vertical')
         histogram.setImageItem(self.image_area.image_item)
         histogram.setLevels(min=0, max=4000)
+        histogram.set_updates_enabled(self.histogram_is_visible)
         return histogram
 
     def connect_signals(self, slider_changed_callback, roi_changed_callback, histogram_changed_callback):
         """Get callbacks that will be invoked when specified event occurs (slider value changed,
-        roi changed, histogram changed)."""
-        self.slicing_slider.valueChanged.connect(slider_changed_callback)
-        self.image_area.roi.sigRegionChanged.connect(roi_changed_callback)
+        roi change finished, histogram changed)."""
+        self.sigSliceChanged.connect(slider_changed_callback)
+        self.image_area.roi.sigRegionChangeFinished.connect(roi_changed_callback)
         self.histogram.sigLevelsChanged.connect(histogram_changed_callback)
 
-    def update_image(self, image):
-        """Get 2D numpy array and display it on widget"""
-        prev_min, prev_max = self.histogram.getLevels()
-        self.image_area.image_item.setImage(image)
-        self.histogram.setLevels(prev_min, prev_max)
+    def update_image(self, image, histogram_key=None):
+        """Get 2D numpy array (row-major image) and display it on widget with current histogram levels.
+        histogram_key (e.g. slice number) allows to reuse histogram computed for the same image."""
+        if image.dtype != np.float32 or not image.flags['C_CONTIGUOUS']:
+            if self.__image_buffer is None or self.__image_buffer.shape != image.shape:
+                self.__image_buffer = np.empty(image.shape, dtype=np.float32)
+            np.copyto(self.__image_buffer, image)
+            image = self.__image_buffer
+
+        self.histogram.image_key = histogram_key
+        levels = self.histogram.getLevels()
+        self.image_area.image_item.setImage(image, autoLevels=False, levels=levels)
 
     def get_metadata_item(self, position):
         """Return metadata item for specified position: TOP_LEFT, TOP_RIGHT, BOTTOM_LEFT, BOTTOM_RIGHT
         (helpers.enums.Location)"""
-        if position == Location.TOP_LEFT:
-            return self.image_area.top_left_label
-        elif position == Location.TOP_RIGHT:
-            return self.image_area.top_right_label
-        elif position == Location.BOTTOM_LEFT:
-            return self.image_area.bottom_left_label
-        elif position == Location.BOTTOM_RIGHT:
-            return self.image_area.bottom_right_label
-        else:
-            raise ValueError(f"Unexpected position value: {position}")
+        return self.image_area.get_metadata_item(position)
 
     def get_image_item(self):
         """Return image item"""
@@ -93,11 +137,13 @@ class ProjectionWidget(QWidget):
         self.image_area.roi.setSize(size)
 
     def set_histogram_visibility(self, visible):
-        """Display (visible==True) or hide (visible==False) histogram."""
+        """Display (visible==True) or hide (visible==False) histogram. Hidden histogram is not updated
+        on image changes."""
         if self.histogram_is_visible == visible:
             return
 
         self.histogram_is_visible = visible
+        self.histogram.set_updates_enabled(visible)
         if visible:
             self.__graphics_widget.ci.addItem(row=0, col=1, item=self.histogram)
         else:
@@ -111,28 +157,24 @@ class ProjectionWidget(QWidget):
         self.roi_is_visible = visible
         if visible:
             self.image_area.addItem(self.image_area.roi)
-            self.image_area.roi.sigRegionChanged.emit(self.image_area.roi)
+            self.image_area.roi.sigRegionChangeFinished.emit(self.image_area.roi)
         else:
             self.image_area.removeItem(self.image_area.roi)
 
     def set_slider(self, position=None, max_val=None):
-        """Set slider on specified position and set specified max value"""
+        """Set slider on specified position and set specified max value. Slice change caused by setting
+        slider position is handled immediately (not coalesced)."""
         if max_val is not None:
             self.slicing_slider.setMaximum(max_val)
 
         if position is not None:
             self.slicing_slider.setSliderPosition(position)
+            self.__slider_timer.stop()
+            self.__emit_slice_change()
 
     def set_projection_orientation(self, up="", bottom="", left="", right=""):
         """Set orientation strings to specify image orientation"""
-        (pg.LabelItem(text=up, size='16pt', parent=self.image_area)
-            .anchor(itemPos=(0, 0), parentPos=(0.5, 0), offset=(0, 20)))
-        (pg.LabelItem(text=bottom, size='16pt', parent=self.image_area)
-            .anchor(itemPos=(0, 0), parentPos=(0.5, 1), offset=(0, -30)))
-        (pg.LabelItem(text=left, size='16pt', parent=self.image_area)
-            .anchor(itemPos=(0, 0), parentPos=(0, 0.5), offset=(10, 0)))
-        (pg.LabelItem(text=right, size='16pt', parent=self.image_area)
-            .anchor(itemPos=(0, 0), parentPos=(1, 0.5), offset=(-30, 0)))
+        self.image_area.set_orientation(up=up, bottom=bottom, left=left, right=right)
 
 
 class ImageArea(pg.PlotItem):
@@ -152,8 +194,25 @@ class ImageArea(pg.PlotItem):
         top_right_label
         bottom_left_label
         bottom_right_label
+        __metadata_items: dict
+            metadata labels keyed by their location (helpers.enums.Location)
+        __orientation_labels: dict
+            labels displaying image orientation at image area edges (keys: up, bottom, left, right)
     """
 
+    METADATA_ANCHORS = {
+        Location.TOP_LEFT: ((0, 0), (0, 0), (10, 10)),
+        Location.TOP_RIGHT: ((1, 0), (1, 0), (-10, 10)),
+        Location.BOTTOM_LEFT: ((0, 1), (0, 1), (10, -10)),
+        Location.BOTTOM_RIGHT: ((1, 1), (1, 1), (-10, -10)),
+    }
+    ORIENTATION_ANCHORS = {
+        'up': ((0.5, 0), (0, 20)),
+        'bottom': ((0.5, 1), (0, -30)),
+        'left': ((0, 0.5), (10, 0)),
+        'right': ((1, 0.5), (-30, 0)),
+    }
+
     def __init__(self, **kargs):
         super().__init__(**kargs)
         self.getViewBox().setAspectLocked(True)
@@ -169,9 +228,17 @@ class ImageArea(pg.PlotItem):
         self.top_right_label = self.__create_metadata_item(Location.TOP_RIGHT)
         self.bottom_left_label = self.__create_metadata_item(Location.BOTTOM_LEFT)
         self.bottom_right_label = self.__create_metadata_item(Location.BOTTOM_RIGHT)
+        self.__metadata_items = {
+            Location.TOP_LEFT: self.top_left_label,
+            Location.TOP_RIGHT: self.top_right_label,
+            Location.BOTTOM_LEFT: self.bottom_left_label,
+            Location.BOTTOM_RIGHT: self.bottom_right_label,
+        }
+        self.__orientation_labels = {edge: self.__create_orientation_label(parent_pos, offset)
+                                     for edge, (parent_pos, offset) in self.ORIENTATION_ANCHORS.items()}
 
     def __create_image_item(self):
-        image_item = pg.ImageItem()
+        image_item = pg.ImageItem(axisOrder='row-major')
         self.addItem(image_item)
         return image_item
 
@@ -183,21 +250,32 @@ class ImageArea(pg.PlotItem):
         return roi
 
     def __create_metadata_item(self, position):
-        md_item = MetadataItem(size='10pt')
-        md_item.setParentItem(self)
-        if position == Location.TOP_LEFT:
-            md_item.anchor(itemPos=(0, 0), parentPos=(0, 0), offset=(10, 10))
-        elif position == Location.TOP_RIGHT:
-            md_item.anchor(itemPos=(1, 0), parentPos=(1, 0), offset=(-10, 10))
-        elif position == Location.BOTTOM_LEFT:
-            md_item.anchor(itemPos=(0, 1), parentPos=(0, 1), offset=(10, -10))
-        elif position == Location.BOTTOM_RIGHT:
-            md_item.anchor(itemPos=(1, 1), parentPos=(1, 1), offset=(-10, -10))
-        else:
+        if position not in self.METADATA_ANCHORS:
             raise ValueError(f"Unexpected position value: {position}")
 
+        item_pos, parent_pos, offset = self.METADATA_ANCHORS[position]
+        md_item = MetadataItem(size='10pt')
+        md_item.setParentItem(self)
+        md_item.anchor(itemPos=item_pos, parentPos=parent_pos, offset=offset)
         return md_item
 
+    def __create_orientation_label(self, parent_pos, offset):
+        label = pg.LabelItem(size='16pt', parent=self)
+        label.anchor(itemPos=(0, 0), parentPos=parent_pos, offset=offset)
+        return label
+
+    def set_orientation(self, **edges_texts):
+        """Set orientation strings displayed at specified image area edges (up, bottom, left, right)"""
+        for edge, text in edges_texts.items():
+            self.__orientation_labels[edge].setText(text, size='16pt')
+
+    def get_metadata_item(self, position):
+        """Return metadata item for specified position (helpers.enums.Location)"""
+        try:
+            return self.__metadata_items[position]
+        except KeyError:
+            raise ValueError(f"Unexpected position value: {position}") from None
+
     def update_roi_position(self, xy_position):
         """Move ROI window to specified position"""
         self.roi.setPos(xy_position)
@@ -214,19 +292,140 @@ class ImageArea(pg.PlotItem):
             self.roi.sigRegionChanged.connect(self.update_roi_position)
             self.addItem(self.roi)
 
+        self.__is_roi_hidden = hide
+
+
+class HistogramItem(pg.HistogramLUTItem):
+    """
+    Histogram item that controls levels and lookup table of the image item. Lookup table generated from
+    the gradient has LUT_SIZE entries (pyqtgraph uses 512 entries for not uint8 images), so windowed image
+    is rendered with 8-bit indexes. Generated lookup table is cached until the gradient is changed.
+    Displayed CT images have integer pixel values, so histogram is counted by numba kernels in single pass
+    (integer bins, about HISTOGRAM_SIZE bins) instead of np.histogram. Histogram is computed from image
+    subsampled with SAMPLING_STEP stride (CT histograms are visually indistinguishable).
+
+    Attributes
+    ----------
+        image_key:
+            key of currently displayed image (e.g. slice number); None if histogram should not be cached
+        __histograms_cache: OrderedDict
+            recently computed histograms (LRU order) keyed by image key, bounded to CACHE_SIZE entries
+        __updates_enabled:
+            flag that informs whether histogram is updated on image item changes
+    """
+
+    LUT_SIZE = 256
+    HISTOGRAM_SIZE = 500
+    SAMPLING_STEP = 4
+    CACHE_SIZE = 512
+
+    def __init__(self, *args, **kargs):
+        super().__init__(*args, **kargs)
+        self.image_key = None
+        self.__histograms_cache = OrderedDict()
+        self.__updates_enabled = True
+
+    def set_updates_enabled(self, enabled):
+        """Enable (enabled==True) or disable (enabled==False) histogram updates on image item changes.
+        Histogram is updated once with current image after enabling."""
+        image_item = self.imageItem()
+        if self.__updates_enabled == enabled or image_item is None:
+            return
+
+        self.__updates_enabled = enabled
+        if enabled:
+            image_item.sigImageChanged.connect(self.imageChanged)
+            self.imageChanged(autoLevel=False, autoRange=False)
+        else:
+            image_item.sigImageChanged.disconnect(self.imageChanged)
+
+    def reset_cache(self):
+        """Remove all cached histograms (e.g. after new volume has been loaded)."""
+        self.__histograms_cache.clear()
+
+    def imageChanged(self, autoLevel=False, autoRange=False):
+        """Update histogram plot (and levels region) based on image item data."""
+        image_item = self.imageItem()
+        if image_item is None or image_item.image is None or image_item.image.size == 0 or self.levelMode != 'mono':
+            super().imageChanged(autoLevel=autoLevel, autoRange=autoRange)
+            return
+
+        for plot in self.plots[1:]:
+            plot.setVisible(False)
+        self.plots[0].setVisible(True)
+
+        bins, counts = self.__get_histogram(image_item.image)
+        self.plot.setData(bins, counts)
+
+        if autoLevel:
+            self.region.setRegion([bins[0], bins[-1]])
+        else:
+            self.region.setRegion(image_item.levels)
+
+    def __get_histogram(self, image):
+        """Return histogram of image from histograms cache (if image key is set) or compute it."""
+        key = self.image_key
+        if key is None:
+            return self.__compute_histogram(image)
+
+        histogram = self.__histograms_cache.get(key)
+        if histogram is None:
+            histogram = self.__compute_histogram(image)
+            self.__histograms_cache[key] = histogram
+            if len(self.__histograms_cache) > self.CACHE_SIZE:
+                self.__histograms_cache.popitem(last=False)
+        self.__histograms_cache.move_to_end(key)
+        return histogram
+
+    def __compute_histogram(self, image):
+        """Return (bins left edges, counts) histogram of integer valued image. Only every SAMPLING_STEP-th pixel
+        (in both axes) is analyzed; counts are scaled, so they correspond to the whole image."""
+        data = image[::self.SAMPLING_STEP, ::self.SAMPLING_STEP]
+
+        min_val, max_val = kernels.min_max(data)
+        bin_width = max(1, -(-(max_val - min_val) // self.HISTOGRAM_SIZE))
+        counts = kernels.bincount(data, min_val, bin_width, (max_val - min_val) // bin_width + 1)
+        counts *= self.SAMPLING_STEP ** 2
+        bins = min_val + bin_width * np.arange(counts.size)
+        return bins, counts
+
+    def getLookupTable(self, img=None, n=None, alpha=None):
+        """Return (cached) lookup table generated from the gradient; LUT_SIZE entries by default."""
+        return super().getLookupTable(img=img, n=self.LUT_SIZE if n is None else n, alpha=alpha)
+
 
 class MetadataItem(pg.LabelItem):
     """
     Item that is displayed in plot as a metadata text.
+
+    Attributes
+    ----------
+        __last_text:
+            last set (text, color, size); allows to skip re-rendering of unchanged text
     """
     def __init__(self, **args):
         super().__init__(**args)
+        self.__last_text = None
 
     def set_metadata(self, metadata_dict, color=None, size='12pt', separator='<br>'):
-        """Set metadata as dict. Entries are separated with <br> by default."""
-        text = separator.join([f'{key}: {value}' for key, value in metadata_dict.items()])
+        """Set metadata as dict. Entries are separated with <br> by default.
+        Text is not re-rendered if metadata and its style have not been changed."""
+        self.batch_update(metadata_dict.items(), color=color, size=size, separator=separator)
+
+    def batch_update(self, entries, color=None, size='12pt', separator='<br>'):
+        """Set metadata as (key, value) entries. All entries are composed into single text, so text
+        is laid out once (and not at all if composed text and its style have not been changed)."""
+        self.set_text(separator.join('%s: %s' % entry for entry in entries), color=color, size=size)
+
+    def set_text(self, text, color=None, size='12pt'):
+        """Set already formatted metadata text. Text is not re-rendered if it has not been changed."""
+        if (text, color, size) == self.__last_text:
+            return
+
+        self.__last_text = text, color, size
         self.setText(text, color=color, size=size)
 
     def clear(self):
         """Set metadata text as empty string."""
+        self.__last_text = None
         self.setText("")
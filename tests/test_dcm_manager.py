@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+from app.helpers import dcm_manager
+
+
+class FakeDataset:
+    def __init__(self, pixel_array):
+        self.pixel_array = pixel_array
+
+
+def make_series(z_size=5, rows=3, cols=4, dtype=np.int16):
+    """Return list of synthetic CT slices (sorted ascending by SliceLocation) with unique pixel values,
+    value = 100 * slice + 10 * row + col"""
+    return [FakeDataset((100 * k + 10 * np.arange(rows)[:, None] + np.arange(cols)[None, :]).astype(dtype))
+            for k in range(z_size)]
+
+
+def test_matrix_layout_and_dtype():
+    series = make_series()
+    matrix_3d = dcm_manager.get_ct_model_as_matrix(series)
+
+    assert matrix_3d.dtype == np.int16
+    assert matrix_3d.flags['C_CONTIGUOUS']
+    # matrix_3d[z, y, x]: z along slices, y along pixel array cols, x along pixel array rows
+    assert matrix_3d.shape == (5, 4, 3)
+
+
+def test_xy_slices_are_transposed_pixel_arrays_in_descending_location_order():
+    series = make_series()
+    matrix_3d = dcm_manager.get_ct_model_as_matrix(series)
+
+    # XY slice n shows pixel array of slice z_size - 1 - n (displayed image[y, x] = pixel_array[x, y]);
+    # it is baseline XY slice n + 1 (baseline placed the first slice at index 0 and the others reversed)
+    for n in range(len(series)):
+        np.testing.assert_array_equal(matrix_3d[n], series[-1 - n].pixel_array.T)
+
+
+def test_xz_and_yz_slices():
+    series = make_series()
+    matrix_3d = dcm_manager.get_ct_model_as_matrix(series)
+    stack = np.stack([ct_s.pixel_array for ct_s in series])
+
+    for n in range(matrix_3d.shape[1]):
+        # XZ slice n: image[z, x] = pixel_array(z_size - 1 - z)[x, n]
+        np.testing.assert_array_equal(matrix_3d[:, n, :], stack[::-1, :, n])
+    for n in range(matrix_3d.shape[2]):
+        # YZ slice n: image[z, y] = pixel_array(z_size - 1 - z)[n, y]
+        np.testing.assert_array_equal(matrix_3d[:, :, n], stack[::-1, n, :])
+
+
+def test_rotation_rotates_every_slice():
+    series = make_series()
+    matrix_3d = dcm_manager.get_ct_model_as_matrix(series, rot_k=1)
+
+    for n in range(len(series)):
+        np.testing.assert_array_equal(matrix_3d[n], np.rot90(series[-1 - n].pixel_array).T)
+
+
+def test_uint16_values_fitting_int16_are_stored_as_int16():
+    matrix_3d = dcm_manager.get_ct_model_as_matrix(make_series(dtype=np.uint16))
+
+    assert matrix_3d.dtype == np.int16
+    assert matrix_3d.max() == 100 * 4 + 10 * 2 + 3
+
+
+@pytest.mark.parametrize("value", [32768, 65535])
+def test_uint16_values_above_int16_range_are_not_wrapped(value):
+    series = make_series(dtype=np.uint16)
+    series[0].pixel_array[0, 0] = value
+    matrix_3d = dcm_manager.get_ct_model_as_matrix(series)
+
+    assert matrix_3d.dtype == np.int32
+    assert matrix_3d[-1, 0, 0] == value
+    assert matrix_3d.min() >= 0
+
+
+def make_dataset(name, location=None, thickness=None):
+    dataset = Dataset()
+    dataset.PatientName = name
+    if location is not None:
+        dataset.SliceLocation = location
+    if thickness is not None:
+        dataset.SliceThickness = thickness
+    return dataset
+
+
+def test_ct_slices_are_sorted_by_numeric_slice_location():
+    datasets = [make_dataset("a", "10"), make_dataset("b", "-2.5"), make_dataset("c", "9.75"),
+                make_dataset("d", "-10")]
+
+    ct_slices = dcm_manager.extract_ct_from_dcm(datasets)
+
+    assert [str(ct_s.PatientName) for ct_s in ct_slices] == ["d", "b", "c", "a"]
+
+
+def test_ct_slices_without_location_are_placed_at_zero_and_non_ct_files_are_skipped():
+    datasets = [make_dataset("a", "5"), make_dataset("b", thickness="2.5"), make_dataset("c", "-5"),
+                make_dataset("not ct")]
+
+    ct_slices = dcm_manager.extract_ct_from_dcm(datasets)
+
+    assert [str(ct_s.PatientName) for ct_s in ct_slices] == ["c", "b", "a"]
+
+
+def write_dcm_file(path, name):
+    dataset = make_dataset(name, "0")
+    dataset.file_meta = FileMetaDataset()
+    dataset.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset.file_meta.MediaStorageSOPClassUID = CTImageStorage
+    dataset.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    dataset.is_little_endian, dataset.is_implicit_VR = True, False
+    dataset.save_as(str(path), write_like_original=False)
+    return str(path)
+
+
+def test_directory_series_contains_only_visible_dcm_files(tmp_path):
+    write_dcm_file(tmp_path / "1.dcm", "a")
+    write_dcm_file(tmp_path / "2.dcm", "b")
+    write_dcm_file(tmp_path / ".hidden.dcm", "hidden")
+    write_dcm_file(tmp_path / "3.dicom", "other extension")
+    (tmp_path / "dir.dcm").mkdir()
+
+    datasets = dcm_manager.get_dcm_from_path(str(tmp_path))
+
+    assert sorted(str(dataset.PatientName) for dataset in datasets) == ["a", "b"]
+
+
+def test_files_list_is_read_in_order(tmp_path):
+    files = [write_dcm_file(tmp_path / f"{k}.dcm", str(k)) for k in (3, 1, 2)]
+
+    assert [str(dataset.PatientName) for dataset in dcm_manager.get_dcm_from_path(files)] == ["3", "1", "2"]
+    assert str(dcm_manager.get_dcm_from_path(files[:1]).PatientName) == "3"
+    assert str(dcm_manager.get_dcm_from_path(files[0]).PatientName) == "3"
+
+
+def test_missing_path_raises_value_error(tmp_path):
+    with pytest.raises(ValueError):
+        dcm_manager.get_dcm_from_path(str(tmp_path / "missing"))
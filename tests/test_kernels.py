@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from app.helpers import kernels
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(0)
+    return rng.integers(-1024, 3072, size=(97, 131)).astype(np.int16)
+
+
+@pytest.mark.parametrize("dtype", [np.int16, np.float32, np.float64])
+def test_mean_std_matches_numpy(image, dtype):
+    matrix = image.astype(dtype)
+    mean, std = kernels.mean_std(matrix)
+
+    assert mean == pytest.approx(np.mean(matrix, dtype=np.float64), rel=1e-9)
+    assert std == pytest.approx(np.std(matrix, dtype=np.float64), rel=1e-9)
+
+
+def test_mean_std_of_view(image):
+    view = image[10:50, 20:90]
+    mean, std = kernels.mean_std(view)
+
+    assert mean == pytest.approx(view.mean(), rel=1e-9)
+    assert std == pytest.approx(view.std(), rel=1e-9)
+
+
+def test_mean_std_of_constant_and_empty_matrix():
+    assert kernels.mean_std(np.full((4, 5), 3000, dtype=np.int16)) == (3000.0, 0.0)
+    assert np.isnan(kernels.mean_std(np.zeros((0, 5), dtype=np.int16))).all()
+
+
+def test_min_max_matches_numpy(image):
+    sample = image.astype(np.float32)[::4, ::4]
+
+    assert kernels.min_max(sample) == (sample.min(), sample.max())
+
+
+@pytest.mark.parametrize("bin_width", [1, 3, 9])
+def test_bincount_matches_numpy(image, bin_width):
+    sample = image.astype(np.float32)[::4, ::4]
+    min_val, max_val = kernels.min_max(sample)
+    n = (max_val - min_val) // bin_width + 1
+    expected = np.bincount((sample.astype(np.int32).ravel() - min_val) // bin_width, minlength=n)
+
+    np.testing.assert_array_equal(kernels.bincount(sample, min_val, bin_width, n), expected)
+
+
+def test_bincount_merges_thread_local_bins(image):
+    sample = image.astype(np.float32)
+    min_val, max_val = kernels.min_max(sample)
+    n = max_val - min_val + 1
+    expected = np.bincount(sample.astype(np.int32).ravel() - min_val, minlength=n)
+
+    for threads in (1, 2, 7, 1000):
+        np.testing.assert_array_equal(kernels._bincount(sample, min_val, 1, n, threads), expected)
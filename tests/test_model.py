@@ -0,0 +1,108 @@
+import numpy as np
+
+from app.helpers.enums import Plain
+from app.model.model import Model, ProjectionModel
+
+
+def make_slice(n):
+    return np.full((2, 3), n, dtype=np.int16)
+
+
+def test_cached_slice_is_returned():
+    projection = ProjectionModel(plain=Plain.XY)
+    img = make_slice(3)
+    projection.cache_slice(img, 3)
+
+    assert projection.get_cached_slice(3) is img
+    assert projection.get_cached_slice(4) is None
+
+
+def test_least_recently_used_slice_is_evicted():
+    projection = ProjectionModel(plain=Plain.XY)
+    for n in range(ProjectionModel.SLICE_CACHE_SIZE):
+        projection.cache_slice(make_slice(n), n)
+
+    # reading slice 0 makes slice 1 the least recently used one
+    assert projection.get_cached_slice(0) is not None
+    projection.cache_slice(make_slice(100), 100)
+
+    assert projection.get_cached_slice(1) is None
+    assert projection.get_cached_slice(0) is not None
+    assert projection.get_cached_slice(100) is not None
+    assert all(projection.get_cached_slice(n) is not None for n in range(2, ProjectionModel.SLICE_CACHE_SIZE))
+
+
+def test_setting_model_matrix_clears_slice_caches():
+    model = Model()
+    model.set_model_matrix(np.zeros((3, 4, 5), dtype=np.int16))
+    for plain in Plain:
+        model.get_projection_model(plain).cache_slice(make_slice(0), 0)
+
+    model.set_model_matrix(np.ones((3, 4, 5), dtype=np.int16))
+
+    assert all(model.get_projection_model(plain).get_cached_slice(0) is None for plain in Plain)
+
+
+def test_slice_extracted_before_matrix_change_is_not_cached():
+    model = Model()
+    model.set_model_matrix(np.zeros((3, 4, 5), dtype=np.int16))
+    projection = model.get_projection_model(Plain.XY)
+
+    # slice is extracted from the old matrix, then the matrix is replaced before the slice is cached
+    generation = projection.get_slice_cache_generation()
+    old_slice = model.get_model_matrix()[0]
+    model.set_model_matrix(np.ones((3, 4, 5), dtype=np.int16))
+    projection.cache_slice(old_slice, 0, generation)
+
+    assert projection.get_cached_slice(0) is None
+
+
+def test_slice_extracted_from_current_matrix_is_cached():
+    model = Model()
+    model.set_model_matrix(np.zeros((3, 4, 5), dtype=np.int16))
+    model.set_model_matrix(np.ones((3, 4, 5), dtype=np.int16))
+    projection = model.get_projection_model(Plain.XY)
+
+    generation = projection.get_slice_cache_generation()
+    img = model.get_model_matrix()[0]
+    projection.cache_slice(img, 0, generation)
+
+    assert projection.get_cached_slice(0) is img
+
+
+def make_projection_with_metadata():
+    projection = ProjectionModel(plain=Plain.XY)
+    projection.set_shape(5, 4, 3)
+    projection.set_img_metadata({"Plane": "Axial", "Slice": "unknown", "Size": "5x4"})
+    return projection
+
+
+def test_img_metadata_text_contains_current_slice():
+    projection = make_projection_with_metadata()
+    projection.set_current_slice(make_slice(0), 0)
+    assert projection.get_img_metadata_text() == "Plane: Axial<br>Slice: 1/3<br>Size: 5x4"
+
+    projection.set_current_slice(make_slice(2), 2)
+    assert projection.get_img_metadata_text() == "Plane: Axial<br>Slice: 3/3<br>Size: 5x4"
+
+
+def test_img_metadata_text_is_invalidated_by_metadata_changes():
+    projection = make_projection_with_metadata()
+    projection.get_img_metadata_text()
+
+    projection.update_img_metadata({"Size": "6x4", "Window Width": "800"})
+    assert projection.get_img_metadata_text() == "Plane: Axial<br>Slice: 1/3<br>Size: 6x4<br>Window Width: 800"
+
+    projection.set_img_metadata({"Plane": "Coronal"})
+    assert projection.get_img_metadata_text() == "Plane: Coronal<br>Slice: 1/3"
+
+
+def test_img_metadata_returns_copy_with_current_slice():
+    projection = make_projection_with_metadata()
+    projection.set_current_slice(make_slice(1), 1)
+
+    img_metadata = projection.get_img_metadata()
+    img_metadata["Size"] = "changed"
+
+    assert img_metadata["Slice"] == "2/3"
+    assert projection.get_img_metadata()["Size"] == "5x4"